@@ -1,42 +1,38 @@
-from langchain_openai import ChatOpenAI
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_core.runnables import RunnablePassthrough, RunnableLambda
-from typing import Dict, List
-import os
+from langchain_core.runnables import RunnableLambda
+from typing import Dict, List, Optional
+import time
 from dotenv import load_dotenv
 
+from state_store import SessionStore
+from chat_router import ChatRouter
+
 load_dotenv()
 
 
 class DentalChatAgent:
     """LangChain-based chat agent for dental X-ray consultation"""
     
-    def __init__(self):
-        """Initialize chat agent with OpenAI model"""
-        # Get API key from environment
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable not set")
-        
-        # Initialize ChatOpenAI model
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=0.7,
-            api_key=api_key
-        )
+    def __init__(self, store: Optional[SessionStore] = None, router: Optional[ChatRouter] = None):
+        """Initialize chat agent with one model per routing config"""
+        # Routes map message types to model configs (model, max_tokens, ...)
+        self.router = router or ChatRouter()
+        self.llms = self.router.build_llms()
         
-        # Store conversation history by session
-        self.conversation_history: Dict[str, List] = {}
-        
-        # Current X-ray context
-        self.xray_context = None
+        # Conversation history and X-ray context live in a shared store so
+        # every worker process sees the same sessions
+        self.store = store or SessionStore()
         
         # Create prompt template
         self.prompt = self._create_prompt()
         
-        # Create chain
-        self.chain = self._create_chain()
+        # Create one chain per route
+        self.chains = {
+            name: self._create_chain(llm, self.router.routes[name].get("instructions", ""))
+            for name, llm in self.llms.items()
+        }
     
     def _create_prompt(self) -> ChatPromptTemplate:
         """Create prompt template for dental assistant"""
@@ -54,6 +50,9 @@ IMPORTANT GUIDELINES:
 CURRENT X-RAY ANALYSIS:
 {xray_context}
 
+RESPONSE LENGTH:
+{length_instructions}
+
 Remember: You are supportive, informative, and always encourage professional dental care when needed."""
 
         prompt = ChatPromptTemplate.from_messages([
@@ -64,20 +63,21 @@ Remember: You are supportive, informative, and always encourage professional den
         
         return prompt
     
-    def _create_chain(self):
-        """Create LangChain runnable chain"""
+    def _create_chain(self, llm: BaseChatModel, length_instructions: str = ""):
+        """Create LangChain runnable chain for one route"""
         
         def format_history(session_id: str) -> List:
             """Get formatted conversation history"""
-            return self.conversation_history.get(session_id, [])
+            return self.get_history(session_id)
         
         def format_xray_context() -> str:
             """Format X-ray context for prompt - FIXED to use new field names"""
-            if not self.xray_context:
+            xray_context = self.store.get_analysis()
+            if not xray_context:
                 return "No X-ray analysis available yet."
             
             # Updated to use 'count' instead of 'total_detections'
-            detections = self.xray_context.get('detections', {})
+            detections = xray_context.get('detections', {})
             total_count = detections.get('count', 0)
             
             context_parts = [
@@ -95,7 +95,7 @@ Remember: You are supportive, informative, and always encourage professional den
             else:
                 context_parts.append("- No significant findings")
             
-            summary = self.xray_context.get('summary', 'No summary available')
+            summary = xray_context.get('summary', 'No summary available')
             context_parts.append(f"\nSummary: {summary}")
             
             return "\n".join(context_parts)
@@ -104,45 +104,57 @@ Remember: You are supportive, informative, and always encourage professional den
         chain = (
             {
                 "xray_context": RunnableLambda(lambda x: format_xray_context()),
+                "length_instructions": RunnableLambda(
+                    lambda x: length_instructions or "Answer as fully as the question needs."
+                ),
                 "history": RunnableLambda(lambda x: format_history(x["session_id"])),
-                "input": RunnablePassthrough()
+                "input": RunnableLambda(lambda x: x["input"])
             }
             | self.prompt
-            | self.llm
+            | llm
         )
         
         return chain
     
     def update_xray_context(self, analysis: Dict):
         """Update X-ray analysis context"""
-        self.xray_context = analysis
+        self.store.set_analysis(analysis)
         print("✅ X-ray context updated for chat agent")
         print(f"📊 Detection count: {analysis.get('detections', {}).get('count', 0)}")
     
     def chat(self, message: str, session_id: str = "default") -> str:
         """Process user message and return response"""
-        
-        # Initialize session history if needed
-        if session_id not in self.conversation_history:
-            self.conversation_history[session_id] = []
-        
         try:
+            # Pick model config for this message
+            route = self.router.route(message, self.store.get_analysis())
+            
             # Invoke chain
-            response = self.chain.invoke({
+            start = time.perf_counter()
+            response = self.chains[route].invoke({
                 "input": message,
                 "session_id": session_id
             })
+            latency_ms = (time.perf_counter() - start) * 1000
+            
+            # Record per-route latency and token usage
+            usage = getattr(response, "usage_metadata", None) or {}
+            self.store.record_chat_metric(
+                route,
+                latency_ms,
+                input_tokens=usage.get("input_tokens", 0),
+                output_tokens=usage.get("output_tokens", 0)
+            )
+            print(f"🧭 Route: {route} ({latency_ms:.0f} ms, {usage.get('output_tokens', 0)} output tokens)")
             
             # Extract response text
             response_text = response.content
             
-            # Update conversation history
-            self.conversation_history[session_id].append(HumanMessage(content=message))
-            self.conversation_history[session_id].append(AIMessage(content=response_text))
-            
-            # Keep only last 10 messages to avoid context overflow
-            if len(self.conversation_history[session_id]) > 10:
-                self.conversation_history[session_id] = self.conversation_history[session_id][-10:]
+            # Update conversation history (store keeps only the last 10 messages
+            # to avoid context overflow)
+            self.store.append_messages(session_id, [
+                {"role": "human", "content": message},
+                {"role": "ai", "content": response_text}
+            ])
             
             return response_text
         
@@ -152,10 +164,12 @@ Remember: You are supportive, informative, and always encourage professional den
     
     def clear_history(self, session_id: str):
         """Clear conversation history for a session"""
-        if session_id in self.conversation_history:
-            del self.conversation_history[session_id]
+        if self.store.clear_history(session_id):
             print(f"🗑️ Cleared history for session: {session_id}")
     
     def get_history(self, session_id: str) -> List:
         """Get conversation history for a session"""
-        return self.conversation_history.get(session_id, [])
\ No newline at end of file
+        return [
+            HumanMessage(content=m["content"]) if m["role"] == "human" else AIMessage(content=m["content"])
+            for m in self.store.get_history(session_id)
+        ]
\ No newline at end of file
@@ -0,0 +1,114 @@
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel, FakeListChatModel
+from langchain_openai import ChatOpenAI
+
+
+# Default routing config. Override with a JSON file of the same shape via CHAT_ROUTES_PATH.
+# Rules are checked in order; a rule matches when all of its conditions hold.
+# "instructions" go into the system prompt so answers fit within "max_tokens".
+# Both default routes use gpt-4o-mini; the savings come from the output caps.
+DEFAULT_ROUTING_CONFIG = {
+    "routes": {
+        "quick": {
+            "model": "gpt-4o-mini", "temperature": 0.3, "max_tokens": 200,
+            "instructions": "Answer in at most 3 short sentences (under 100 words). Always finish your last sentence."
+        },
+        "detailed": {
+            "model": "gpt-4o-mini", "temperature": 0.7, "max_tokens": 800,
+            "instructions": "Give a complete but focused explanation in under 400 words. Always finish your last sentence."
+        }
+    },
+    "rules": [
+        # Long questions need room for a full answer
+        {"route": "detailed", "min_words": 25},
+        # Explanations, treatment and risk questions (whole-word, case-insensitive)
+        {"route": "detailed", "keywords": [
+            "explain", "why", "treatment", "treat", "options", "compare",
+            "serious", "worried", "risk", "prognosis", "what should i do"
+        ]},
+        # Questions about the results when several kinds of findings were detected
+        {"route": "detailed", "min_findings": 2, "keywords": [
+            "x-ray", "xray", "finding", "findings", "result", "results",
+            "detected", "detection", "detections", "found", "all"
+        ]},
+        # Everything else that is short is a quick factual/clarifying question
+        {"route": "quick", "max_words": 15}
+    ],
+    "default_route": "detailed"
+}
+
+
+class ChatRouter:
+    """Picks a model config (route) for each chat message"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        """Load routing config (argument, CHAT_ROUTES_PATH file, or defaults)"""
+        if config is None:
+            config_path = os.getenv("CHAT_ROUTES_PATH")
+            if config_path:
+                with open(config_path) as f:
+                    config = json.load(f)
+            else:
+                config = DEFAULT_ROUTING_CONFIG
+
+        self.routes: Dict[str, Dict] = config["routes"]
+        self.rules: List[Dict] = config.get("rules", [])
+        self.default_route: str = config.get("default_route", next(iter(self.routes)))
+
+        unknown = {rule["route"] for rule in self.rules} - set(self.routes)
+        if self.default_route not in self.routes or unknown:
+            raise ValueError(f"Chat routing config references unknown routes: {unknown or self.default_route}")
+
+    def route(self, message: str, xray_context: Optional[Dict] = None) -> str:
+        """Return the route name for a message"""
+        text = message.lower()
+        word_count = len(re.findall(r"\w+", text))
+        finding_count = len((xray_context or {}).get("detections", {}).get("classes", {}))
+
+        for rule in self.rules:
+            if "min_words" in rule and word_count < rule["min_words"]:
+                continue
+            if "max_words" in rule and word_count > rule["max_words"]:
+                continue
+            if "min_findings" in rule and finding_count < rule["min_findings"]:
+                continue
+            if "keywords" in rule and not any(
+                re.search(rf"\b{re.escape(k)}\b", text) for k in rule["keywords"]
+            ):
+                continue
+            return rule["route"]
+
+        return self.default_route
+
+    def build_llms(self) -> Dict[str, BaseChatModel]:
+        """Create one chat model per route"""
+        return {name: self._build_llm(route) for name, route in self.routes.items()}
+
+    def _build_llm(self, route: Dict) -> BaseChatModel:
+        """Create the chat model for a route config"""
+        # CHAT_LLM_PROVIDER=fake swaps every route to a local fake model (tests, offline runs)
+        provider = os.getenv("CHAT_LLM_PROVIDER") or route.get("provider", "openai")
+
+        if provider == "fake":
+            return FakeListChatModel(responses=route.get("fake_responses", [
+                "This is a test response from the local fake dental assistant model."
+            ]))
+
+        if provider != "openai":
+            raise ValueError(f"Unknown chat LLM provider: {provider}")
+
+        # Get API key from environment
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY environment variable not set")
+
+        return ChatOpenAI(
+            model=route["model"],
+            temperature=route.get("temperature", 0.7),
+            max_tokens=route.get("max_tokens"),
+            api_key=api_key
+        )
@@ -0,0 +1,71 @@
+# Gunicorn config for multi-worker production serving
+#
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# Scaling knobs (defaults fill the node without oversubscribing cores):
+#   WEB_CONCURRENCY    number of worker processes = model replicas (default: usable CPUs)
+#   TORCH_NUM_THREADS  inference threads per replica (default: usable CPUs // workers)
+# More workers favour upload throughput; more threads per worker favour the
+# latency of a single large radiograph. Keep workers * threads <= cores.
+import gc
+import os
+
+import torch
+
+
+def usable_cpus() -> int:
+    """CPUs this process may use: affinity mask, capped by the cgroup CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # Container CPU limits (cgroup v2, then v1); a 1.5 CPU quota counts as 1
+    quota_files = [
+        ("/sys/fs/cgroup/cpu.max", None),
+        ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us"),
+    ]
+    for quota_path, period_path in quota_files:
+        try:
+            with open(quota_path) as f:
+                values = f.read().split()
+            if period_path:
+                with open(period_path) as f:
+                    values.append(f.read().strip())
+            quota, period = values[0], values[1]
+        except (OSError, IndexError):
+            continue
+        if quota not in ("max", "-1"):
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+        break
+
+    return cpus
+
+
+cpu_count = usable_cpus()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", cpu_count))
+worker_class = "uvicorn_worker.UvicornWorker"
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+
+# Import the app (and load the model) in the master so workers share the
+# weights copy-on-write instead of each loading their own copy
+preload_app = True
+
+if not os.getenv("TORCH_NUM_THREADS"):
+    os.environ["TORCH_NUM_THREADS"] = str(max(1, cpu_count // workers))
+
+
+def on_starting(server):
+    """Load models in the master process before workers are forked"""
+    import main
+    main.load_models()
+    # Move loaded objects out of the GC's reach so collections in the workers
+    # don't touch (and un-share) the preloaded pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Re-apply per-replica thread limits in each forked worker"""
+    torch.set_num_threads(int(os.environ["TORCH_NUM_THREADS"]))
@@ -0,0 +1,100 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict
+
+from state_store import SessionStore
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity"""
+
+
+class AnalysisJobQueue:
+    """Bounded in-process queue that runs X-ray analysis jobs on background threads"""
+
+    def __init__(self, store: SessionStore, analyze_fn: Callable[..., Dict],
+                 num_workers: int = 1, max_pending: int = 8):
+        """
+        analyze_fn(file_path, output_filename, on_stage) runs the analysis
+        stages and returns the analysis dict. Job status is kept in the shared
+        store so any worker process can answer status requests.
+        """
+        self.store = store
+        self.analyze_fn = analyze_fn
+        self.num_workers = num_workers
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._threads = []
+        # Set in start() so each forked worker process gets its own owner id
+        self.owner = None
+
+    def start(self):
+        """Start worker threads (call after the process has forked)"""
+        if self._threads:
+            return
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._worker, name=f"analysis-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="analysis-job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        print(f"🧰 Started {self.num_workers} analysis job worker(s)")
+
+    def submit(self, job_id: str, file_path: Path, output_filename: str):
+        """Queue an analysis job (raises QueueFullError and removes the upload if full)"""
+        if self.owner is None:
+            raise RuntimeError("Analysis job queue has not been started")
+        self.store.create_job(job_id, self.owner)
+        try:
+            self._queue.put_nowait((job_id, file_path, output_filename))
+        except queue.Full:
+            self.store.delete_job(job_id)
+            file_path.unlink(missing_ok=True)
+            raise QueueFullError("Too many analysis jobs in progress, please retry shortly")
+
+    def pending(self) -> int:
+        """Number of jobs waiting to start"""
+        return self._queue.qsize()
+
+    def _worker(self):
+        """Process queued jobs forever"""
+        while True:
+            job_id, file_path, output_filename = self._queue.get()
+            try:
+                self._run(job_id, file_path, output_filename)
+            finally:
+                self._queue.task_done()
+
+    def _heartbeat(self):
+        """Keep this process's unfinished jobs from being marked stale"""
+        interval = max(self.store.job_stale_s / 4, 1)
+        while True:
+            time.sleep(interval)
+            try:
+                self.store.heartbeat_jobs(self.owner)
+            except Exception as e:
+                print(f"⚠️ Job heartbeat failed: {str(e)}")
+
+    def _run(self, job_id: str, file_path: Path, output_filename: str):
+        """Run one job and record its progress and outcome"""
+        def on_stage(stage: str):
+            self.store.update_job(job_id, "running", stage=stage)
+
+        try:
+            analysis = self.analyze_fn(file_path, output_filename, on_stage)
+            self.store.update_job(job_id, "completed", stage="done", result={
+                "success": True,
+                "message": "X-ray analyzed successfully",
+                "detections": analysis["detections"],
+                "output_image_path": output_filename,
+                "analysis_summary": analysis["summary"],
+                "memory": analysis["memory"]
+            })
+        except Exception as e:
+            print(f"❌ Job {job_id} failed: {str(e)}")
+            self.store.update_job(job_id, "failed", error=f"Analysis failed: {str(e)}")
@@ -1,15 +1,22 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Callable
 import uvicorn
+import asyncio
 import os
+import sys
+import uuid
+import time
 from pathlib import Path
 import shutil
 
 from model_handler import DentalModelHandler
 from chat_agent import DentalChatAgent
+from state_store import SessionStore
+from job_queue import AnalysisJobQueue, QueueFullError
 
 # Initialize FastAPI app
 app = FastAPI(title="Dental AI Assistant API", version="1.0.0")
@@ -29,24 +36,38 @@ OUTPUT_DIR = Path("outputs")
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+# How often job websockets check the shared store for updates (seconds)
+JOB_POLL_INTERVAL = 0.5
+# Longest a job websocket stays open; clients fall back to polling after it closes
+JOB_WS_MAX_SECONDS = float(os.getenv("JOB_WS_MAX_SECONDS", "600"))
+
 # Initialize model handler and chat agent (loaded once)
 model_handler = None
 chat_agent = None
 
-# Store current analysis results
-current_analysis = {}
+# Current analysis and chat sessions are shared by all worker processes
+store = SessionStore()
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Load models once on startup"""
+def load_models():
+    """Load models once per process (no-op if already loaded before fork)"""
     global model_handler, chat_agent
+    if model_handler is not None and chat_agent is not None:
+        return
     print("🚀 Loading YOLO model and initializing chat agent...")
     model_handler = DentalModelHandler()
-    chat_agent = DentalChatAgent()
+    chat_agent = DentalChatAgent(store=store)
     print("✅ Models loaded successfully!")
 
 
+@app.on_event("startup")
+async def startup_event():
+    """Load models once on startup"""
+    load_models()
+    # Job threads are started per worker process (threads don't survive a fork)
+    job_queue.start()
+
+
 # Pydantic models
 class ChatRequest(BaseModel):
     message: str
@@ -58,12 +79,18 @@ class ChatResponse(BaseModel):
     session_id: str
 
 
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+
+
 class AnalysisResponse(BaseModel):
     success: bool
     message: str
     detections: Dict
     output_image_path: str
     analysis_summary: str
+    memory: Optional[Dict] = None
 
 
 @app.get("/")
@@ -74,64 +101,213 @@ async def root():
         "message": "Dental AI Assistant API is running",
         "endpoints": {
             "upload": "/api/upload-xray",
+            "upload_job": "/api/jobs/upload-xray",
+            "job_status": "/api/jobs/{job_id}",
+            "job_updates": "/api/jobs/{job_id}/ws",
             "chat": "/api/chat",
             "get_image": "/api/image/{filename}",
-            "current_analysis": "/api/current-analysis"
+            "current_analysis": "/api/current-analysis",
+            "chat_metrics": "/api/chat-metrics",
+            "stats": "/api/stats"
         }
     }
 
 
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident memory of this worker process in MB (None where unsupported)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes on Linux
+    peak = round(peak / 2**20 if sys.platform == "darwin" else peak / 2**10, 1)
+    # Inference resets the kernel's high-water mark; the handler keeps the earlier peak
+    if model_handler is not None and model_handler.lifetime_peak_rss_mb is not None:
+        peak = max(peak, model_handler.lifetime_peak_rss_mb)
+    return peak
+
+
+def current_rss_mb() -> Optional[float]:
+    """
+    Current resident memory of this worker process in MB (Linux only)
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    
+    return round(rss_pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+
+
+def memory_breakdown() -> Optional[Dict]:
+    """
+    Private vs. shared resident memory of this worker in MB (Linux only).
+    Pages still shared copy-on-write with the master (model weights) count as shared.
+    """
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return None
+    
+    return {
+        "private_mb": round((fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)) / 2**10, 1),
+        "shared_mb": round((fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)) / 2**10, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 2**10, 1)
+    }
+
+
+def dir_stats(directory: Path) -> Dict:
+    """
+    File count and total size of a directory
+    """
+    count, total = 0, 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file():
+                count += 1
+                total += entry.stat().st_size
+    return {
+        "files": count,
+        "mb": round(total / 2**20, 1)
+    }
+
+
+def collect_stats() -> Dict:
+    """
+    Gather worker memory, stored state and file counts (blocking I/O)
+    """
+    return {
+        "pid": os.getpid(),
+        "rss_mb": current_rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+        "memory": memory_breakdown(),
+        "pending_jobs": job_queue.pending(),
+        "store": store.get_stats(),
+        "uploads": dir_stats(UPLOAD_DIR),
+        "outputs": dir_stats(OUTPUT_DIR)
+    }
+
+
+def analyze_xray(file_path: Path, output_filename: str,
+                 on_stage: Optional[Callable[[str], None]] = None) -> Dict:
+    """
+    Run inference, save the visualization and update chat context
+    """
+    on_stage = on_stage or (lambda stage: None)
+    rss_before = current_rss_mb()
+    
+    # Decode once; inference and rendering share this buffer
+    image = model_handler.load_image(str(file_path))
+    
+    # Run inference
+    print("🔍 Running YOLO inference...")
+    on_stage("predict")
+    result = model_handler.predict(image)
+    
+    # Extract detections
+    on_stage("extract_detections")
+    detections = model_handler.extract_detections(result)
+    
+    # Generate analysis summary
+    on_stage("generate_summary")
+    analysis_summary = model_handler.generate_summary(detections)
+    
+    # Visualize and save output
+    on_stage("visualize_result")
+    output_path = OUTPUT_DIR / output_filename
+    overlay_bytes = model_handler.visualize_result(result, str(output_path), image=image)
+    
+    # Decode and overlay sizes are exact; the inference peak is measured by the handler
+    inference_memory = result.inference_memory
+    rss_after = current_rss_mb()
+    memory = {
+        "image_shape": list(image.shape),
+        "request": {
+            "decode_buffer_mb": round(image.nbytes / 2**20, 1),
+            "overlay_buffer_mb": round(overlay_bytes / 2**20, 1),
+            "inference_peak_delta_mb": inference_memory["peak_delta_mb"],
+            "inference_peak_source": inference_memory["source"],
+            # Approximate when other requests run concurrently in this worker
+            "rss_delta_mb": round(rss_after - rss_before, 1) if rss_before is not None else None
+        },
+        "process": {
+            "rss_mb": rss_after,
+            "inference_peak_rss_mb": inference_memory["peak_rss_mb"],
+            "lifetime_peak_rss_mb": peak_rss_mb()
+        }
+    }
+    print(f"🧠 Memory: {memory}")
+    
+    # Store current analysis for chat context
+    analysis = {
+        "detections": detections,
+        "summary": analysis_summary,
+        "image_path": str(file_path),
+        "output_path": str(output_path),
+        "memory": memory
+    }
+    
+    # Update chat agent context (persisted in the shared store)
+    chat_agent.update_xray_context(analysis)
+    
+    return analysis
+
+
+def save_upload(file: UploadFile, upload_id: str) -> Path:
+    """
+    Save uploaded file to the uploads directory, prefixed with a unique ID so
+    concurrent uploads with the same client filename don't overwrite each other
+    """
+    file_path = UPLOAD_DIR / f"{upload_id}_{Path(file.filename).name}"
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    
+    print(f"📁 File saved: {file_path}")
+    return file_path
+
+
+# Background analysis jobs (bounded queue gives backpressure under load)
+job_queue = AnalysisJobQueue(
+    store,
+    analyze_xray,
+    num_workers=int(os.getenv("JOB_WORKERS", "1")),
+    max_pending=int(os.getenv("JOB_QUEUE_SIZE", "8"))
+)
+
+
 @app.post("/api/upload-xray", response_model=AnalysisResponse)
 async def upload_xray(file: UploadFile = File(...)):
     """
     Upload and analyze dental X-ray image
     """
-    global current_analysis
-    
     try:
         # Validate file type
         if not file.content_type.startswith("image/"):
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Save uploaded file
-        file_path = UPLOAD_DIR / file.filename
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        print(f"📁 File saved: {file_path}")
-        
-        # Run inference
-        print("🔍 Running YOLO inference...")
-        result = model_handler.predict(str(file_path))
+        file_path = await run_in_threadpool(save_upload, file, uuid.uuid4().hex)
         
-        # Visualize and save output
-        output_filename = f"analyzed_{file.filename}"
-        output_path = OUTPUT_DIR / output_filename
-        model_handler.visualize_result(result, str(output_path))
-        
-        # Extract detections
-        detections = model_handler.extract_detections(result)
-        
-        # Generate analysis summary
-        analysis_summary = model_handler.generate_summary(detections)
-        
-        # Store current analysis for chat context
-        current_analysis = {
-            "detections": detections,
-            "summary": analysis_summary,
-            "image_path": str(file_path),
-            "output_path": str(output_path)
-        }
-        
-        # Update chat agent context
-        chat_agent.update_xray_context(current_analysis)
+        # Run inference off the event loop so the worker keeps serving other requests
+        output_filename = f"analyzed_{file_path.name}"
+        analysis = await run_in_threadpool(analyze_xray, file_path, output_filename)
         
         return AnalysisResponse(
             success=True,
             message="X-ray analyzed successfully",
-            detections=detections,
+            detections=analysis["detections"],
             output_image_path=output_filename,
-            analysis_summary=analysis_summary
+            analysis_summary=analysis["summary"],
+            memory=analysis["memory"]
         )
     
     except Exception as e:
@@ -139,20 +315,82 @@ async def upload_xray(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 
+@app.post("/api/jobs/upload-xray", response_model=JobResponse, status_code=202)
+async def submit_xray_job(file: UploadFile = File(...)):
+    """
+    Upload an X-ray and analyze it in the background; returns a job ID immediately
+    """
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    job_id = uuid.uuid4().hex
+    file_path = await run_in_threadpool(save_upload, file, job_id)
+    
+    try:
+        await run_in_threadpool(job_queue.submit, job_id, file_path, f"analyzed_{file_path.name}")
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    
+    return JobResponse(job_id=job_id, status="queued")
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Get analysis job status (and result once completed)
+    """
+    job = await run_in_threadpool(store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job
+
+
+@app.websocket("/api/jobs/{job_id}/ws")
+async def job_updates(websocket: WebSocket, job_id: str):
+    """
+    Push job status updates until the job completes or fails (or the
+    connection reaches JOB_WS_MAX_SECONDS)
+    """
+    await websocket.accept()
+    last_update = None
+    deadline = time.monotonic() + JOB_WS_MAX_SECONDS
+    
+    try:
+        while time.monotonic() < deadline:
+            job = await run_in_threadpool(store.get_job, job_id)
+            if job is None:
+                await websocket.send_json({"job_id": job_id, "status": "not_found"})
+                break
+            
+            if job["updated_at"] != last_update:
+                last_update = job["updated_at"]
+                await websocket.send_json(job)
+            
+            if job["status"] in ("completed", "failed"):
+                break
+            
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+    except WebSocketDisconnect:
+        return
+    
+    await websocket.close()
+
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """
     Chat with dental assistant about X-ray results
     """
     try:
-        if not current_analysis:
+        if not await run_in_threadpool(store.get_analysis):
             return ChatResponse(
                 response="Please upload an X-ray image first so I can assist you with the analysis.",
                 session_id=request.session_id
             )
         
         # Get response from chat agent
-        response = chat_agent.chat(request.message, request.session_id)
+        response = await run_in_threadpool(chat_agent.chat, request.message, request.session_id)
         
         return ChatResponse(
             response=response,
@@ -181,6 +419,7 @@ async def get_current_analysis():
     """
     Get current X-ray analysis
     """
+    current_analysis = await run_in_threadpool(store.get_analysis)
     if not current_analysis:
         return {"message": "No analysis available. Please upload an X-ray first."}
     
@@ -190,14 +429,35 @@ async def get_current_analysis():
     }
 
 
+@app.get("/api/chat-metrics")
+async def get_chat_metrics():
+    """
+    Get per-route chat latency and token usage
+    """
+    return {
+        "routes": await run_in_threadpool(store.get_chat_metrics)
+    }
+
+
+@app.get("/api/stats")
+async def get_stats():
+    """
+    Memory, stored state and file counts for this worker (used by soak tests)
+    """
+    # Directory scans grow with soak length; keep them off the event loop
+    return await run_in_threadpool(collect_stats)
+
+
 @app.delete("/api/clear-session/{session_id}")
 async def clear_session(session_id: str):
     """
     Clear chat history for a session
     """
-    chat_agent.clear_history(session_id)
+    await run_in_threadpool(chat_agent.clear_history, session_id)
     return {"message": f"Session {session_id} cleared successfully"}
 
 
 if __name__ == "__main__":
+    # Development server (single process, auto-reload).
+    # For multi-worker production serving use: gunicorn -c gunicorn.conf.py main:app
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -2,8 +2,33 @@ from huggingface_hub import hf_hub_download
 from ultralytics import YOLO
 import cv2
 import numpy as np
+import os
+import threading
+import torch
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Union
+
+
+def _status_mb(field: str) -> Optional[float]:
+    """Read a memory field (VmRSS, VmHWM) of /proc/self/status in MB (Linux only)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return round(int(line.split()[1]) / 2**10, 1)
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    """Reset this process's VmHWM to its current RSS (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
 
 
 class DentalModelHandler:
@@ -14,6 +39,8 @@ class DentalModelHandler:
         self.repo_id = "abdulsamad99/dental-yolo-segmentation"
         self.model = None
         self.names = None
+        # Ultralytics predictors are not thread-safe; one inference at a time per process
+        self._predict_lock = threading.Lock()
         self.class_colors = {
             0: (144, 238, 144),  # Healthy_Tooth - Light Green
             1: (255, 69, 0),     # Caries - Red-Orange
@@ -22,8 +49,25 @@ class DentalModelHandler:
             4: (255, 0, 0),      # Infection - Red
             5: (220, 20, 60),    # Fractured_Tooth - Crimson
         }
+        # Preprocessing: cap the longest image side (0 = keep full resolution)
+        # and decode X-rays as single-channel before expanding to BGR once
+        self.max_image_side = int(os.getenv("MAX_IMAGE_SIDE", "0"))
+        self.grayscale = os.getenv("XRAY_GRAYSCALE", "1") == "1"
+        # Model input size (longest letterboxed side), read from the checkpoint
+        self.imgsz = None
+        # predict() resets VmHWM (and with it ru_maxrss), so keep the lifetime peak here
+        self.lifetime_peak_rss_mb: Optional[float] = None
+        self._configure_threads()
         self._load_model()
     
+    def _configure_threads(self):
+        """Limit intra-op threads per model replica (TORCH_NUM_THREADS)"""
+        num_threads = os.getenv("TORCH_NUM_THREADS")
+        if num_threads:
+            torch.set_num_threads(int(num_threads))
+            cv2.setNumThreads(int(num_threads))
+            print(f"🧵 Using {num_threads} inference thread(s) per worker")
+    
     def _load_model(self):
         """Load YOLO model from Hugging Face"""
         try:
@@ -35,45 +79,118 @@ class DentalModelHandler:
             )
             
             self.model = YOLO(model_path)
+            # Fuse Conv+BN now (before gunicorn forks) so the predictor's fuse in
+            # each worker is a no-op and the weights stay shared copy-on-write
+            self.model.fuse()
             self.names = self.model.names
+            self.imgsz = self.model.overrides.get("imgsz", 640)
             print("✅ YOLO model loaded successfully!")
             print(f"Classes: {self.names}")
+            print(f"Input size: {self.imgsz}")
         except Exception as e:
             print(f"❌ Error loading model: {str(e)}")
             raise
     
-    def predict(self, image_path: str, conf: float = 0.25, iou: float = 0.7):
-        """Run inference on image with 25% confidence threshold to capture all detections"""
+    def load_image(self, image_path: str) -> np.ndarray:
+        """Decode image once into the canonical BGR buffer shared by inference and rendering"""
+        flag = cv2.IMREAD_GRAYSCALE if self.grayscale else cv2.IMREAD_COLOR
+        img = cv2.imread(image_path, flag)
+        if img is None:
+            raise ValueError(f"Could not read image: {image_path}")
+        
+        # Downscale before channel expansion so the resize touches 1 channel, not 3
+        h, w = img.shape[:2]
+        if self.max_image_side and max(h, w) > self.max_image_side:
+            scale = self.max_image_side / max(h, w)
+            img = cv2.resize(
+                img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA
+            )
+        
+        # Model and colored overlays need 3 channels
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        
+        return img
+    
+    def predict(self, image: Union[str, np.ndarray], conf: float = 0.25, iou: float = 0.7):
+        """
+        Run inference on image with 25% confidence threshold to capture all detections.
+        The measured memory peak is attached as `result.inference_memory`.
+        """
         if self.model is None:
             raise Exception("Model not loaded")
         
-        results = self.model.predict(
-            source=image_path,
-            conf=conf,  # Now defaults to 0.60 (60%)
-            iou=iou,
-            device='cpu'
-        )
+        with self._predict_lock:
+            # Reset the high-water mark so VmHWM afterwards is the peak of this inference
+            # (it also includes any other threads of this worker running meanwhile)
+            self._track_peak_rss()
+            peak_reset = _reset_peak_rss()
+            rss_before = _status_mb("VmRSS")
+            results = self.model.predict(
+                source=image,
+                conf=conf,  # Now defaults to 0.60 (60%)
+                iou=iou,
+                device='cpu'
+            )
+            rss_after = _status_mb("VmRSS")
+            peak = _status_mb("VmHWM") if peak_reset else None
+            self._track_peak_rss()
         
-        return results[0]
+        result = results[0]
+        result.inference_memory = self._inference_memory(rss_before, rss_after, peak)
+        return result
+    
+    def _track_peak_rss(self):
+        """Fold the current VmHWM into the lifetime peak before it is reset"""
+        hwm = _status_mb("VmHWM")
+        if hwm is not None:
+            self.lifetime_peak_rss_mb = max(self.lifetime_peak_rss_mb or 0, hwm)
     
-    def visualize_result(self, result, save_path: str):
-        """Create visualization with masks and bounding boxes"""
-        img = result.orig_img.copy()
+    @staticmethod
+    def _inference_memory(rss_before: Optional[float], rss_after: Optional[float],
+                          peak: Optional[float]) -> Dict:
+        """Peak RSS during one inference and its growth over the RSS before it (MB)"""
+        if rss_before is None:
+            return {"peak_rss_mb": None, "peak_delta_mb": None, "source": "unavailable"}
+        if peak is not None:
+            return {"peak_rss_mb": peak, "peak_delta_mb": round(peak - rss_before, 1),
+                    "source": "VmHWM"}
+        # Without clear_refs only the RSS left after inference is known: a lower bound
+        return {"peak_rss_mb": max(rss_before, rss_after),
+                "peak_delta_mb": round(max(rss_after - rss_before, 0), 1),
+                "source": "rss_after (lower bound)"}
+    
+    def visualize_result(self, result, save_path: str, image: Optional[np.ndarray] = None) -> int:
+        """
+        Create visualization with masks and bounding boxes.
+        If `image` (the canonical buffer from load_image) is given it is drawn
+        on in place instead of copying result.orig_img.
+        Returns the size in bytes of the temporary overlay buffer.
+        """
+        img = image if image is not None else result.orig_img.copy()
+        overlay_bytes = 0
         
         if result.masks is None:
             print("⚠️ No masks detected in image.")
             cv2.imwrite(save_path, img)
-            return
+            return overlay_bytes
         
-        # Draw masks
-        overlay = img.copy()
-        for mask, cls in zip(result.masks.xy, result.boxes.cls):
-            class_id = int(cls)
-            color = self.class_colors.get(class_id, (128, 128, 128))
-            pts = mask.reshape((-1, 1, 2)).astype(np.int32)
-            cv2.fillPoly(overlay, [pts], color)
-        
-        img = cv2.addWeighted(overlay, 0.25, img, 0.75, 0)
+        # Draw masks, blending only the region they cover
+        polys = [
+            (mask.reshape((-1, 1, 2)).astype(np.int32), int(cls))
+            for mask, cls in zip(result.masks.xy, result.boxes.cls)
+            if len(mask)
+        ]
+        if polys:
+            x, y, w, h = cv2.boundingRect(np.concatenate([pts for pts, _ in polys]))
+            roi = img[y:y + h, x:x + w]
+            overlay = roi.copy()
+            overlay_bytes = overlay.nbytes
+            for pts, class_id in polys:
+                color = self.class_colors.get(class_id, (128, 128, 128))
+                cv2.fillPoly(overlay, [pts - (x, y)], color)
+            
+            cv2.addWeighted(overlay, 0.25, roi, 0.75, 0, dst=roi)
         
         # Draw bounding boxes and labels
         for box, cls in zip(result.boxes.xyxy, result.boxes.cls):
@@ -116,6 +233,7 @@ class DentalModelHandler:
         Path(save_path).parent.mkdir(parents=True, exist_ok=True)
         cv2.imwrite(save_path, img)
         print(f"💾 Saved visualization to: {save_path}")
+        return overlay_bytes
     
     def extract_detections(self, result) -> Dict:
         """Extract detection information from result - FIXED to match frontend interface"""
@@ -21,6 +21,7 @@ export function ChatInterface() {
   const [isLoading, setIsLoading] = useState(false);
   const [uploadedFile, setUploadedFile] = useState<File | null>(null);
   const [analysisResult, setAnalysisResult] = useState<AnalysisResponse | null>(null);
+  const [analysisJobId, setAnalysisJobId] = useState<string | null>(null);
   const [isUploading, setIsUploading] = useState(false);
   const [showImagePanel, setShowImagePanel] = useState(false);
 
@@ -45,38 +46,52 @@ export function ChatInterface() {
     }
 
     setUploadedFile(file);
+    setAnalysisResult(null);
+    setAnalysisJobId(null);
     setIsUploading(true);
 
     try {
-      const result = await apiService.uploadXray(file);
-      setAnalysisResult(result);
+      // Analysis runs as a background job; the image panel follows its progress
+      const jobId = await apiService.submitXrayJob(file);
+      setAnalysisJobId(jobId);
       setShowImagePanel(true);
-
-      setMessages(prev => [
-        ...prev,
-        {
-          id: Date.now().toString(),
-          role: 'assistant',
-          content: `X-ray analysis complete! ${result.analysis_summary}\n\nFeel free to ask me any questions about the findings.`,
-          timestamp: new Date(),
-        },
-      ]);
     } catch (error) {
       console.error('Upload error:', error);
-      setMessages(prev => [
-        ...prev,
-        {
-          id: Date.now().toString(),
-          role: 'assistant',
-          content: 'Sorry, there was an error analyzing the X-ray. Please make sure the backend server is running and try again.',
-          timestamp: new Date(),
-        },
-      ]);
-    } finally {
-      setIsUploading(false);
+      handleAnalysisFailed();
     }
   };
 
+  const handleAnalysisComplete = (result: AnalysisResponse) => {
+    setAnalysisResult(result);
+    setAnalysisJobId(null);
+    setIsUploading(false);
+
+    setMessages(prev => [
+      ...prev,
+      {
+        id: Date.now().toString(),
+        role: 'assistant',
+        content: `X-ray analysis complete! ${result.analysis_summary}\n\nFeel free to ask me any questions about the findings.`,
+        timestamp: new Date(),
+      },
+    ]);
+  };
+
+  const handleAnalysisFailed = () => {
+    // Keep the job ID so the image panel can show the job's error
+    setIsUploading(false);
+
+    setMessages(prev => [
+      ...prev,
+      {
+        id: Date.now().toString(),
+        role: 'assistant',
+        content: 'Sorry, there was an error analyzing the X-ray. Please make sure the backend server is running and try again.',
+        timestamp: new Date(),
+      },
+    ]);
+  };
+
   const handleSendMessage = async () => {
     if (!inputMessage.trim() || isLoading) return;
 
@@ -135,6 +150,8 @@ export function ChatInterface() {
   const removeUploadedFile = () => {
     setUploadedFile(null);
     setAnalysisResult(null);
+    setAnalysisJobId(null);
+    setIsUploading(false);
     setShowImagePanel(false);
   };
 
@@ -217,11 +234,16 @@ export function ChatInterface() {
         </div>
       </div>
 
-      {showImagePanel && analysisResult && (
-        <ImageAnalysisPanel
-          analysisResult={analysisResult}
-          onClose={() => setShowImagePanel(false)}
-        />
+      {(analysisResult || analysisJobId) && (
+        <div className={showImagePanel ? 'flex' : 'hidden'}>
+          <ImageAnalysisPanel
+            analysisResult={analysisResult}
+            jobId={analysisJobId}
+            onAnalysisComplete={handleAnalysisComplete}
+            onAnalysisFailed={handleAnalysisFailed}
+            onClose={() => setShowImagePanel(false)}
+          />
+        </div>
       )}
     </div>
   );
@@ -1,15 +1,99 @@
-import { X, AlertTriangle, CheckCircle, Info } from 'lucide-react';
-import { AnalysisResponse } from '../types';
+import { useEffect, useRef, useState } from 'react';
+import { X, AlertTriangle, CheckCircle, Info, Loader2 } from 'lucide-react';
+import { AnalysisJob, AnalysisResponse } from '../types';
 import { DentalAPIService } from '../services/api';
 
 interface ImageAnalysisPanelProps {
-  analysisResult: AnalysisResponse;
+  analysisResult: AnalysisResponse | null;
+  jobId?: string | null;
+  onAnalysisComplete?: (result: AnalysisResponse) => void;
+  onAnalysisFailed?: (error: string) => void;
   onClose: () => void;
 }
 
 const apiService = new DentalAPIService();
 
-export function ImageAnalysisPanel({ analysisResult, onClose }: ImageAnalysisPanelProps) {
+const STAGE_LABELS: Record<string, string> = {
+  predict: 'Running detection model...',
+  extract_detections: 'Extracting findings...',
+  generate_summary: 'Summarizing results...',
+  visualize_result: 'Rendering annotated X-ray...',
+};
+
+export function ImageAnalysisPanel({
+  analysisResult,
+  jobId,
+  onAnalysisComplete,
+  onAnalysisFailed,
+  onClose,
+}: ImageAnalysisPanelProps) {
+  const [job, setJob] = useState<AnalysisJob | null>(null);
+
+  // Keep latest callbacks without re-subscribing on every parent render
+  const onCompleteRef = useRef(onAnalysisComplete);
+  const onFailedRef = useRef(onAnalysisFailed);
+  onCompleteRef.current = onAnalysisComplete;
+  onFailedRef.current = onAnalysisFailed;
+
+  // Follow the background analysis job until it finishes
+  useEffect(() => {
+    if (!jobId) return;
+
+    const unsubscribe = apiService.subscribeToJob(jobId, (update) => {
+      setJob(update);
+      if (update.status === 'completed' && update.result) {
+        onCompleteRef.current?.(update.result);
+      } else if (update.status === 'failed' || update.status === 'not_found') {
+        onFailedRef.current?.(update.error || 'Analysis job not found');
+      }
+    });
+
+    return unsubscribe;
+  }, [jobId]);
+
+  if (!analysisResult) {
+    const stageLabel = job?.stage ? STAGE_LABELS[job.stage] : null;
+
+    return (
+      <div className="w-96 bg-white border-l border-gray-200 overflow-y-auto">
+        <div className="sticky top-0 bg-white border-b border-gray-200 p-4 flex items-center justify-between z-10">
+          <h2 className="text-lg font-bold text-gray-900">Analysis Results</h2>
+          <button
+            onClick={onClose}
+            className="p-2 hover:bg-gray-100 rounded-lg transition-colors"
+          >
+            <X className="w-5 h-5 text-gray-600" />
+          </button>
+        </div>
+
+        <div className="p-4">
+          {job?.status === 'failed' ? (
+            <div className="bg-red-50 border border-red-200 rounded-lg p-4">
+              <div className="flex items-start gap-3">
+                <AlertTriangle className="w-5 h-5 text-red-600 flex-shrink-0 mt-0.5" />
+                <p className="text-sm text-red-900">{job.error || 'Analysis failed'}</p>
+              </div>
+            </div>
+          ) : (
+            <div className="bg-blue-50 border border-blue-200 rounded-lg p-4">
+              <div className="flex items-center gap-3">
+                <Loader2 className="w-5 h-5 text-blue-600 animate-spin flex-shrink-0" />
+                <div>
+                  <p className="text-sm font-medium text-blue-900">
+                    {job?.status === 'running' ? 'Analyzing X-ray' : 'Waiting in queue'}
+                  </p>
+                  {stageLabel && (
+                    <p className="text-xs text-blue-700 mt-1">{stageLabel}</p>
+                  )}
+                </div>
+              </div>
+            </div>
+          )}
+        </div>
+      </div>
+    );
+  }
+
   const imageUrl = apiService.getImageUrl(analysisResult.output_image_path);
   const { detections } = analysisResult;
 
@@ -1,6 +1,16 @@
-import { AnalysisResponse, ChatResponse } from '../types';
+import { AnalysisJob, AnalysisResponse, ChatResponse } from '../types';
 
 const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+const JOB_POLL_INTERVAL_MS = 1000;
+
+// Analysis payload as returned by the backend (fields may be missing)
+type RawAnalysisResponse = Partial<Omit<AnalysisResponse, 'detections'>> & {
+  detections?: Partial<AnalysisResponse['detections']>;
+};
+
+type RawAnalysisJob = Omit<AnalysisJob, 'result'> & {
+  result?: RawAnalysisResponse | null;
+};
 
 export class DentalAPIService {
   private sessionId: string;
@@ -34,26 +44,107 @@ export class DentalAPIService {
       const data = await response.json();
       console.log('✅ Upload successful, full data:', JSON.stringify(data, null, 2));
       
-      // Ensure the response matches AnalysisResponse interface
-      const analysisResponse: AnalysisResponse = {
-        success: data.success ?? true,
-        message: data.message ?? '',
-        detections: {
-          count: data.detections?.count ?? 0,
-          classes: data.detections?.classes ?? {},
-          details: data.detections?.details ?? []
-        },
-        output_image_path: data.output_image_path ?? '',
-        analysis_summary: data.analysis_summary ?? ''
-      };
-      
-      return analysisResponse;
+      return this.toAnalysisResponse(data);
     } catch (error) {
       console.error('❌ Upload error:', error);
       throw error;
     }
   }
 
+  async submitXrayJob(file: File): Promise<string> {
+    const formData = new FormData();
+    formData.append('file', file);
+
+    console.log('🚀 Submitting analysis job:', file.name);
+
+    const response = await fetch(`${API_BASE_URL}/api/jobs/upload-xray`, {
+      method: 'POST',
+      body: formData,
+    });
+
+    if (!response.ok) {
+      const errorText = await response.text();
+      console.error('❌ Job submit error:', errorText);
+      throw new Error(`Failed to submit X-ray: ${response.status} - ${errorText}`);
+    }
+
+    const data = await response.json();
+    console.log('✅ Job queued:', data.job_id);
+
+    return data.job_id;
+  }
+
+  async getJob(jobId: string): Promise<AnalysisJob> {
+    const response = await fetch(`${API_BASE_URL}/api/jobs/${jobId}`);
+
+    // Unknown or expired job: report it as finished so polling stops
+    if (response.status === 404) {
+      return { job_id: jobId, status: 'not_found' };
+    }
+
+    if (!response.ok) {
+      throw new Error(`Failed to get job status: ${response.status}`);
+    }
+
+    return this.toAnalysisJob(await response.json());
+  }
+
+  /**
+   * Subscribe to job updates over a websocket, falling back to polling if the
+   * socket can't be opened. Returns an unsubscribe function.
+   */
+  subscribeToJob(jobId: string, onUpdate: (job: AnalysisJob) => void): () => void {
+    let stopped = false;
+    let pollTimer: ReturnType<typeof setTimeout> | null = null;
+    let socket: WebSocket | null = null;
+
+    const isFinished = (job: AnalysisJob) =>
+      job.status === 'completed' || job.status === 'failed' || job.status === 'not_found';
+
+    const poll = async () => {
+      if (stopped) return;
+      try {
+        const job = await this.getJob(jobId);
+        if (stopped) return;
+        onUpdate(job);
+        if (isFinished(job)) return;
+      } catch (error) {
+        console.error('❌ Job poll error:', error);
+      }
+      pollTimer = setTimeout(poll, JOB_POLL_INTERVAL_MS);
+    };
+
+    try {
+      const wsUrl = `${API_BASE_URL.replace(/^http/, 'ws')}/api/jobs/${jobId}/ws`;
+      socket = new WebSocket(wsUrl);
+      let finished = false;
+
+      socket.onmessage = (event) => {
+        const job = this.toAnalysisJob(JSON.parse(event.data));
+        if (stopped) return;
+        onUpdate(job);
+        finished = isFinished(job);
+      };
+
+      socket.onclose = () => {
+        // Connection dropped before the job finished (e.g. proxy timeout)
+        if (!finished && !stopped) {
+          console.log('📡 Job websocket closed, falling back to polling');
+          poll();
+        }
+      };
+    } catch (error) {
+      console.error('❌ Job websocket error:', error);
+      poll();
+    }
+
+    return () => {
+      stopped = true;
+      if (pollTimer) clearTimeout(pollTimer);
+      socket?.close();
+    };
+  }
+
   async sendMessage(message: string): Promise<string> {
     try {
       console.log('💬 Sending message:', message);
@@ -115,6 +206,31 @@ export class DentalAPIService {
     return response.json();
   }
 
+  private toAnalysisJob(data: RawAnalysisJob): AnalysisJob {
+    return {
+      job_id: data.job_id,
+      status: data.status,
+      stage: data.stage ?? null,
+      result: data.result ? this.toAnalysisResponse(data.result) : null,
+      error: data.error ?? null,
+    };
+  }
+
+  private toAnalysisResponse(data: RawAnalysisResponse): AnalysisResponse {
+    // Ensure the response matches AnalysisResponse interface
+    return {
+      success: data.success ?? true,
+      message: data.message ?? '',
+      detections: {
+        count: data.detections?.count ?? 0,
+        classes: data.detections?.classes ?? {},
+        details: data.detections?.details ?? []
+      },
+      output_image_path: data.output_image_path ?? '',
+      analysis_summary: data.analysis_summary ?? ''
+    };
+  }
+
   async clearSession(): Promise<void> {
     await fetch(`${API_BASE_URL}/api/clear-session/${this.sessionId}`, {
       method: 'DELETE',
@@ -21,6 +21,16 @@ export interface AnalysisResponse {
   analysis_summary: string;
 }
 
+export type AnalysisJobStatus = 'queued' | 'running' | 'completed' | 'failed' | 'not_found';
+
+export interface AnalysisJob {
+  job_id: string;
+  status: AnalysisJobStatus;
+  stage?: string | null;
+  result?: AnalysisResponse | null;
+  error?: string | null;
+}
+
 export interface ChatMessage {
   id: string;
   role: 'user' | 'assistant';
@@ -0,0 +1,248 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class SessionStore:
+    """SQLite (WAL) store for analysis and chat state shared across worker processes"""
+
+    def __init__(self, db_path: Optional[str] = None, max_history: int = 10,
+                 job_retention_s: Optional[float] = None, job_stale_s: Optional[float] = None):
+        """Open the store and create tables if needed"""
+        self.db_path = db_path or os.getenv("STATE_DB_PATH", "state/dental_state.db")
+        self.max_history = max_history
+        # Finished jobs older than this are deleted when new jobs are created
+        self.job_retention_s = job_retention_s if job_retention_s is not None else \
+            float(os.getenv("JOB_RETENTION_MINUTES", "60")) * 60
+        # Queued/running jobs whose owner has not sent a heartbeat for this long are
+        # marked failed (the worker process that owned them died or was restarted)
+        self.job_stale_s = job_stale_s if job_stale_s is not None else \
+            float(os.getenv("JOB_STALE_SECONDS", "60"))
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        # One connection per thread and per process (connections must not cross a fork)
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get a connection for the current thread/process"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        """Create tables used by the API"""
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id);
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                stage TEXT,
+                result TEXT,
+                error TEXT,
+                owner TEXT,
+                heartbeat_at REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chat_metrics (
+                route TEXT PRIMARY KEY,
+                requests INTEGER NOT NULL DEFAULT 0,
+                total_latency_ms REAL NOT NULL DEFAULT 0,
+                max_latency_ms REAL NOT NULL DEFAULT 0,
+                input_tokens INTEGER NOT NULL DEFAULT 0,
+                output_tokens INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        # Databases created before jobs had owners
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        if "heartbeat_at" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+
+    # Current analysis
+
+    def set_analysis(self, analysis: Dict):
+        """Store the latest X-ray analysis"""
+        self._connect().execute(
+            "INSERT OR REPLACE INTO kv (key, value) VALUES ('current_analysis', ?)",
+            (json.dumps(analysis),)
+        )
+
+    def get_analysis(self) -> Dict:
+        """Get the latest X-ray analysis (empty dict if none)"""
+        row = self._connect().execute(
+            "SELECT value FROM kv WHERE key = 'current_analysis'"
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    # Conversation history
+
+    def get_history(self, session_id: str) -> List[Dict]:
+        """Get conversation history as a list of {"role", "content"} dicts"""
+        rows = self._connect().execute(
+            "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id",
+            (session_id,)
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def append_messages(self, session_id: str, messages: List[Dict]):
+        """Append messages and keep only the last `max_history` for the session"""
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
+                [(session_id, m["role"], m["content"]) for m in messages]
+            )
+            conn.execute(
+                """DELETE FROM messages WHERE session_id = ? AND id NOT IN (
+                       SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?
+                   )""",
+                (session_id, session_id, self.max_history)
+            )
+
+    def clear_history(self, session_id: str) -> bool:
+        """Delete conversation history for a session"""
+        cursor = self._connect().execute(
+            "DELETE FROM messages WHERE session_id = ?", (session_id,)
+        )
+        return cursor.rowcount > 0
+
+    # Analysis jobs
+
+    def create_job(self, job_id: str, owner: str):
+        """Register a new queued analysis job (and sweep expired and stale jobs)"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?",
+            (now - self.job_retention_s,)
+        )
+        self._fail_stale_jobs(conn, now)
+        conn.execute(
+            "INSERT INTO jobs (id, status, owner, heartbeat_at, created_at, updated_at) "
+            "VALUES (?, 'queued', ?, ?, ?, ?)",
+            (job_id, owner, now, now, now)
+        )
+
+    def delete_job(self, job_id: str):
+        """Remove a job row"""
+        self._connect().execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def update_job(self, job_id: str, status: str, stage: Optional[str] = None,
+                   result: Optional[Dict] = None, error: Optional[str] = None):
+        """Update job status, current stage and (when finished) result or error"""
+        now = time.time()
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, stage = ?, result = ?, error = ?, "
+            "heartbeat_at = ?, updated_at = ? WHERE id = ?",
+            (status, stage, json.dumps(result) if result is not None else None,
+             error, now, now, job_id)
+        )
+
+    def heartbeat_jobs(self, owner: str):
+        """Mark all unfinished jobs of an owner as still alive"""
+        self._connect().execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN ('queued', 'running')",
+            (time.time(), owner)
+        )
+
+    def _fail_stale_jobs(self, conn: sqlite3.Connection, now: float, job_id: Optional[str] = None):
+        """Fail unfinished jobs whose owner stopped sending heartbeats (optionally just one job)"""
+        query = ("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? "
+                 "WHERE status IN ('queued', 'running') AND COALESCE(heartbeat_at, updated_at) < ?")
+        params = ["Analysis worker stopped before the job finished, please upload again",
+                  now, now - self.job_stale_s]
+        if job_id is not None:
+            query += " AND id = ?"
+            params.append(job_id)
+        conn.execute(query, params)
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Get a job as a dict (None if unknown; stale unfinished jobs are failed first)"""
+        conn = self._connect()
+        self._fail_stale_jobs(conn, time.time(), job_id)
+        row = conn.execute(
+            "SELECT id, status, stage, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0],
+            "status": row[1],
+            "stage": row[2],
+            "result": json.loads(row[3]) if row[3] else None,
+            "error": row[4],
+            "created_at": row[5],
+            "updated_at": row[6]
+        }
+
+    # Chat routing metrics
+
+    def record_chat_metric(self, route: str, latency_ms: float,
+                           input_tokens: int = 0, output_tokens: int = 0):
+        """Add one chat request to the per-route totals"""
+        self._connect().execute(
+            """INSERT INTO chat_metrics (route, requests, total_latency_ms, max_latency_ms,
+                                         input_tokens, output_tokens)
+               VALUES (?, 1, ?, ?, ?, ?)
+               ON CONFLICT (route) DO UPDATE SET
+                   requests = requests + 1,
+                   total_latency_ms = total_latency_ms + excluded.total_latency_ms,
+                   max_latency_ms = MAX(max_latency_ms, excluded.max_latency_ms),
+                   input_tokens = input_tokens + excluded.input_tokens,
+                   output_tokens = output_tokens + excluded.output_tokens""",
+            (route, latency_ms, latency_ms, input_tokens, output_tokens)
+        )
+
+    def get_chat_metrics(self) -> Dict[str, Dict]:
+        """Per-route request counts, latency and token totals"""
+        rows = self._connect().execute(
+            "SELECT route, requests, total_latency_ms, max_latency_ms, input_tokens, output_tokens "
+            "FROM chat_metrics ORDER BY route"
+        ).fetchall()
+        return {
+            route: {
+                "requests": requests,
+                "avg_latency_ms": round(total_latency / requests, 1),
+                "max_latency_ms": round(max_latency, 1),
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "avg_output_tokens": round(output_tokens / requests, 1)
+            }
+            for route, requests, total_latency, max_latency, input_tokens, output_tokens in rows
+        }
+
+    # Soak-test stats
+
+    def get_stats(self) -> Dict[str, int]:
+        """Row counts used to spot unbounded state growth"""
+        conn = self._connect()
+        return {
+            "sessions": conn.execute("SELECT COUNT(DISTINCT session_id) FROM messages").fetchone()[0],
+            "messages": conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0],
+            "jobs": conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+        }
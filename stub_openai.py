@@ -0,0 +1,59 @@
+"""
+Minimal OpenAI-compatible chat completions server for offline load tests.
+
+Run:
+    uvicorn stub_openai:app --port 8001
+
+Then start the backend against it:
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=stub python main.py
+"""
+from fastapi import FastAPI, Request
+import asyncio
+import os
+import random
+import time
+import uuid
+
+app = FastAPI(title="Stub OpenAI API")
+
+# Simulated model latency in seconds (uniform between min and max)
+LATENCY_MIN = float(os.getenv("STUB_LATENCY_MIN", "0.2"))
+LATENCY_MAX = float(os.getenv("STUB_LATENCY_MAX", "0.8"))
+
+STUB_REPLY = (
+    "Based on your X-ray analysis, the detected findings should be reviewed by a dentist. "
+    "Caries are areas of tooth decay that can usually be treated with a filling when caught early. "
+    "Please schedule a dental visit for a professional examination."
+)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    """Return a canned completion, respecting max_tokens"""
+    body = await request.json()
+    await asyncio.sleep(random.uniform(LATENCY_MIN, LATENCY_MAX))
+
+    words = STUB_REPLY.split()
+    max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+    if max_tokens:
+        words = words[:max_tokens]
+    content = " ".join(words)
+
+    prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "length" if max_tokens and len(words) == max_tokens else "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words)
+        }
+    }
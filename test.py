@@ -1,226 +1,377 @@
-import requests
+"""
+Load and soak test harness for the Dental AI Assistant backend.
+
+Mixes X-ray uploads and multi-turn chat sessions at a target rate, samples
+worker memory and stored state via /api/stats, and writes a latency/throughput
+report. Run offline against the stub OpenAI server and the production
+(multi-worker) server; numbers from the single-process reload server
+(python main.py) say nothing about capacity:
+
+    uvicorn stub_openai:app --port 8001
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=stub gunicorn -c gunicorn.conf.py main:app
+    python test.py --duration 60 --rate 2
+
+Soak test (30 minutes, keep chat sessions to watch history growth):
+
+    python test.py --duration 1800 --rate 1 --keep-sessions
+"""
+import argparse
+import asyncio
 import json
-from pathlib import Path
+import random
+import re
+import statistics
 import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+DEFAULT_BASE_URL = "http://localhost:8000"
+DEFAULT_IMAGES = ["tooth.jpg", "uploads/tooth*.jpg"]
+
+# Files the server saved from earlier load-test runs (never replayed as samples)
+LOADTEST_UPLOAD_RE = re.compile(r"(^|_)lt\d+_")
+
+CHAT_QUESTIONS = [
+    "What did you find in my X-ray?",
+    "What is a fractured tooth?",
+    "Should I be worried about the findings?",
+    "What is an impacted tooth?",
+    "Can you explain the treatment options for caries?",
+    "How serious are the detected issues?",
+    "Should I see a dentist immediately?",
+]
 
-# Base URL for the API
-BASE_URL = "http://localhost:8000"
 
 def print_separator():
-    print("\n" + "="*70 + "\n")
+    print("\n" + "=" * 70 + "\n")
 
-def test_health_check():
-    """Test 1: Health check endpoint"""
-    print("TEST 1: Health Check")
-    print_separator()
-    
-    response = requests.get(f"{BASE_URL}/")
-    print(f"Status Code: {response.status_code}")
-    print(f"Response: {json.dumps(response.json(), indent=2)}")
-    
-    assert response.status_code == 200, "Health check failed"
-    print("✅ Health check passed!")
-
-def test_upload_xray(image_path: str):
-    """Test 2: Upload and analyze X-ray"""
-    print("TEST 2: Upload X-ray Image")
-    print_separator()
-    
-    if not Path(image_path).exists():
-        print(f"❌ Image file not found: {image_path}")
-        print("Please provide a valid X-ray image path")
-        return None
-    
-    with open(image_path, 'rb') as f:
-        files = {'file': (Path(image_path).name, f, 'image/jpeg')}
-        
-        print(f"Uploading: {image_path}")
-        print("Please wait, this may take a few seconds...")
-        
-        response = requests.post(f"{BASE_URL}/api/upload-xray", files=files)
-    
-    print(f"Status Code: {response.status_code}")
-    
-    if response.status_code == 200:
-        result = response.json()
-        print("\n📊 Analysis Results:")
-        print(f"Success: {result['success']}")
-        print(f"Message: {result['message']}")
-        print(f"\nDetections: {json.dumps(result['detections'], indent=2)}")
-        print(f"\nAnalysis Summary:\n{result['analysis_summary']}")
-        print(f"\nOutput Image: {result['output_image_path']}")
-        print("✅ Upload and analysis passed!")
-        return result
-    else:
-        print(f"❌ Upload failed: {response.text}")
+
+class Recorder:
+    """Collects per-operation latencies and errors"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Dict[str, int]] = {}
+
+    def record(self, op: str, latency: float, ok: bool, status: str = "ok"):
+        """Record one request outcome (latency in seconds)"""
+        if ok:
+            self.latencies.setdefault(op, []).append(latency)
+        else:
+            op_errors = self.errors.setdefault(op, {})
+            op_errors[status] = op_errors.get(status, 0) + 1
+
+    def summary(self, duration: float) -> Dict[str, Dict]:
+        """Per-operation throughput and latency percentiles (ms)"""
+        summary = {}
+        for op in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies.get(op, []))
+            errors = sum(self.errors.get(op, {}).values())
+            stats = {
+                "ok": len(values),
+                "errors": errors,
+                "error_breakdown": self.errors.get(op, {}),
+                "throughput_rps": round(len(values) / duration, 2) if duration else 0.0
+            }
+            if values:
+                stats.update({
+                    "p50_ms": round(percentile(values, 50) * 1000, 1),
+                    "p95_ms": round(percentile(values, 95) * 1000, 1),
+                    "p99_ms": round(percentile(values, 99) * 1000, 1),
+                    "max_ms": round(values[-1] * 1000, 1),
+                    "mean_ms": round(statistics.mean(values) * 1000, 1)
+                })
+            summary[op] = stats
+        return summary
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def load_images(patterns: List[str]) -> List[Path]:
+    """Resolve image paths/globs relative to the current directory"""
+    images = []
+    for pattern in patterns:
+        if any(ch in pattern for ch in "*?["):
+            images.extend(
+                path for path in sorted(Path(".").glob(pattern))
+                if not LOADTEST_UPLOAD_RE.search(path.name)
+            )
+        elif Path(pattern).exists():
+            images.append(Path(pattern))
+    return images
+
+
+async def timed_request(client: httpx.AsyncClient, recorder: Recorder, op: str,
+                        method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+    """Send a request and record its latency/outcome"""
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        recorder.record(op, time.perf_counter() - start, False, type(e).__name__)
         return None
 
-def test_chat(message: str, session_id: str = "test_session"):
-    """Test 3: Chat with dental assistant"""
-    print(f"TEST 3: Chat - '{message}'")
-    print_separator()
-    
-    payload = {
-        "message": message,
-        "session_id": session_id
+    latency = time.perf_counter() - start
+    ok = response.is_success
+    recorder.record(op, latency, ok, "ok" if ok else str(response.status_code))
+    return response if ok else None
+
+
+async def upload_scenario(client: httpx.AsyncClient, args, images: List[Path],
+                          recorder: Recorder, n: int):
+    """Upload one X-ray (synchronously or as a background job)"""
+    image = random.choice(images)
+    files = {"file": (f"lt{n}_{image.name}", image.read_bytes(), "image/jpeg")}
+
+    if not args.jobs:
+        await timed_request(client, recorder, "upload", "POST", "/api/upload-xray", files=files)
+        return
+
+    start = time.perf_counter()
+    response = await timed_request(client, recorder, "job_submit", "POST", "/api/jobs/upload-xray", files=files)
+    if response is None:
+        return
+
+    job_id = response.json()["job_id"]
+    while time.perf_counter() - start < args.timeout:
+        await asyncio.sleep(args.poll_interval)
+        response = await timed_request(client, recorder, "job_poll", "GET", f"/api/jobs/{job_id}")
+        if response is None:
+            continue
+        status = response.json()["status"]
+        if status in ("completed", "failed"):
+            recorder.record("job_total", time.perf_counter() - start, status == "completed", status)
+            return
+
+    # Job lost (404, server restart, ...) or stuck past the request timeout
+    recorder.record("job_total", time.perf_counter() - start, False, "timeout")
+
+
+async def chat_scenario(client: httpx.AsyncClient, args, recorder: Recorder):
+    """Run one multi-turn chat session"""
+    session_id = f"loadtest_{uuid.uuid4().hex[:12]}"
+    for _ in range(args.chat_turns):
+        await timed_request(
+            client, recorder, "chat", "POST", "/api/chat",
+            json={"message": random.choice(CHAT_QUESTIONS), "session_id": session_id}
+        )
+        await asyncio.sleep(args.think_time)
+
+    if not args.keep_sessions:
+        await timed_request(client, recorder, "clear_session", "DELETE", f"/api/clear-session/{session_id}")
+
+
+async def monitor(client: httpx.AsyncClient, interval: float, stop: asyncio.Event,
+                  samples: List[Dict], start: float):
+    """Sample /api/stats until stopped"""
+    while not stop.is_set():
+        try:
+            response = await client.get("/api/stats")
+            if response.is_success:
+                sample = response.json()
+                sample["t"] = round(time.perf_counter() - start, 1)
+                samples.append(sample)
+        except httpx.HTTPError:
+            pass
+
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def slope_per_minute(points: List[tuple]) -> float:
+    """Least-squares slope of (seconds, value) points, per minute"""
+    if len(points) < 2:
+        return 0.0
+    mean_t = statistics.mean(t for t, _ in points)
+    mean_v = statistics.mean(v for _, v in points)
+    denom = sum((t - mean_t) ** 2 for t, _ in points)
+    if denom == 0:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in points) / denom * 60
+
+
+def growth_report(samples: List[Dict]) -> Dict:
+    """Memory growth per worker and growth of stored state/files"""
+    by_pid: Dict[int, List[Dict]] = {}
+    for sample in samples:
+        if sample.get("rss_mb") is not None:
+            by_pid.setdefault(sample["pid"], []).append(sample)
+
+    workers = {
+        str(pid): {
+            "samples": len(points),
+            "rss_start_mb": points[0]["rss_mb"],
+            "rss_end_mb": points[-1]["rss_mb"],
+            "rss_slope_mb_per_min": round(slope_per_minute([(p["t"], p["rss_mb"]) for p in points]), 2),
+            "peak_rss_mb": max(p.get("peak_rss_mb") or 0 for p in points),
+            # Private memory is what each extra worker really costs; shared is the
+            # preloaded model still shared copy-on-write with the master
+            "private_end_mb": (points[-1].get("memory") or {}).get("private_mb"),
+            "shared_end_mb": (points[-1].get("memory") or {}).get("shared_mb")
+        }
+        for pid, points in by_pid.items()
     }
-    
-    response = requests.post(f"{BASE_URL}/api/chat", json=payload)
-    print(f"Status Code: {response.status_code}")
-    
-    if response.status_code == 200:
-        result = response.json()
-        print(f"\n🤖 Assistant Response:\n{result['response']}")
-        print(f"\nSession ID: {result['session_id']}")
-        print("✅ Chat passed!")
-    else:
-        print(f"❌ Chat failed: {response.text}")
-
-def test_get_image(output_image_path: str):
-    """Test 4: Retrieve analyzed image"""
-    print("TEST 4: Get Analyzed Image")
-    print_separator()
-    
-    response = requests.get(f"{BASE_URL}/api/image/{output_image_path}")
-    print(f"Status Code: {response.status_code}")
-    
-    if response.status_code == 200:
-        # Save the image locally to verify
-        save_path = Path("test_output") / output_image_path
-        save_path.parent.mkdir(exist_ok=True)
-        
-        with open(save_path, 'wb') as f:
-            f.write(response.content)
-        
-        print(f"✅ Image retrieved and saved to: {save_path}")
-    else:
-        print(f"❌ Image retrieval failed: {response.text}")
-
-def test_current_analysis():
-    """Test 5: Get current analysis"""
-    print("TEST 5: Get Current Analysis")
+
+    state = {}
+    if samples:
+        first, last = samples[0], samples[-1]
+        for key in ("sessions", "messages", "jobs"):
+            state[key] = {"start": first["store"][key], "end": last["store"][key]}
+        for key in ("uploads", "outputs"):
+            state[f"{key}_files"] = {"start": first[key]["files"], "end": last[key]["files"]}
+            state[f"{key}_mb"] = {"start": first[key]["mb"], "end": last[key]["mb"]}
+
+    return {"workers": workers, "state": state}
+
+
+async def run(args) -> Dict:
+    """Drive the mixed workload and build the report"""
+    images = load_images(args.images)
+    if not images:
+        raise SystemExit(f"❌ No images found for: {args.images}")
+
+    recorder = Recorder()
+    samples: List[Dict] = []
+    limits = httpx.Limits(max_connections=args.max_concurrency)
+    timeout = httpx.Timeout(args.timeout)
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=timeout) as client:
+        # Preflight: server is up and has an analysis so chats get real context
+        response = await client.get("/")
+        response.raise_for_status()
+        response = await client.post(
+            "/api/upload-xray", files={"file": (images[0].name, images[0].read_bytes(), "image/jpeg")}
+        )
+        response.raise_for_status()
+
+        print(f"🚀 Running for {args.duration}s at {args.rate} scenarios/s "
+              f"({args.upload_ratio:.0%} uploads) against {args.base_url}")
+
+        start = time.perf_counter()
+        stop = asyncio.Event()
+        monitor_task = asyncio.create_task(monitor(client, args.stats_interval, stop, samples, start))
+        semaphore = asyncio.Semaphore(args.max_concurrency)
+        tasks = set()
+        dropped = 0
+
+        async def bounded(coro):
+            async with semaphore:
+                await coro
+
+        # Open-loop arrivals: scenarios start on schedule regardless of response times
+        n = 0
+        while time.perf_counter() - start < args.duration:
+            n += 1
+            if semaphore.locked():
+                dropped += 1
+            elif random.random() < args.upload_ratio:
+                tasks.add(asyncio.create_task(bounded(upload_scenario(client, args, images, recorder, n))))
+            else:
+                tasks.add(asyncio.create_task(bounded(chat_scenario(client, args, recorder))))
+            tasks = {t for t in tasks if not t.done()}
+            await asyncio.sleep(random.expovariate(args.rate))
+
+        print(f"⏳ Waiting for {len(tasks)} in-flight scenario(s)...")
+        await asyncio.gather(*tasks, return_exceptions=True)
+        duration = time.perf_counter() - start
+
+        stop.set()
+        await monitor_task
+        # Final sample after the load has drained
+        try:
+            final = (await client.get("/api/stats")).json()
+            final["t"] = round(time.perf_counter() - start, 1)
+            samples.append(final)
+        except httpx.HTTPError:
+            pass
+
+        chat_metrics = None
+        try:
+            chat_metrics = (await client.get("/api/chat-metrics")).json()
+        except httpx.HTTPError:
+            pass
+
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "report"},
+        "duration_s": round(duration, 1),
+        "scenarios_started": n - dropped,
+        "scenarios_dropped": dropped,
+        "operations": recorder.summary(duration),
+        "growth": growth_report(samples),
+        "chat_metrics": chat_metrics,
+        "samples": samples
+    }
+
+
+def print_report(report: Dict):
+    """Human-readable summary of the report"""
     print_separator()
-    
-    response = requests.get(f"{BASE_URL}/api/current-analysis")
-    print(f"Status Code: {response.status_code}")
-    print(f"Response: {json.dumps(response.json(), indent=2)}")
-    
-    assert response.status_code == 200, "Current analysis check failed"
-    print("✅ Current analysis check passed!")
-
-def test_clear_session(session_id: str = "test_session"):
-    """Test 6: Clear session history"""
-    print("TEST 6: Clear Session History")
+    print("📊 LOAD TEST REPORT".center(70))
     print_separator()
-    
-    response = requests.delete(f"{BASE_URL}/api/clear-session/{session_id}")
-    print(f"Status Code: {response.status_code}")
-    print(f"Response: {json.dumps(response.json(), indent=2)}")
-    
-    assert response.status_code == 200, "Clear session failed"
-    print("✅ Clear session passed!")
-
-def run_all_tests():
-    """Run all tests in sequence"""
-    print("\n" + "🧪 STARTING DENTAL CHATBOT BACKEND TESTS ".center(70, "="))
+    print(f"Duration: {report['duration_s']}s  Scenarios: {report['scenarios_started']}  "
+          f"Dropped (concurrency cap): {report['scenarios_dropped']}\n")
+
+    print(f"{'operation':<15}{'ok':>7}{'err':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for op, stats in report["operations"].items():
+        print(f"{op:<15}{stats['ok']:>7}{stats['errors']:>6}{stats['throughput_rps']:>8}"
+              f"{stats.get('p50_ms', '-'):>9}{stats.get('p95_ms', '-'):>9}"
+              f"{stats.get('p99_ms', '-'):>9}{stats.get('max_ms', '-'):>9}")
+
+    growth = report["growth"]
+    if growth["workers"]:
+        print("\n🧠 Worker memory (MB)")
+        for pid, stats in growth["workers"].items():
+            print(f"  pid {pid}: {stats['rss_start_mb']} -> {stats['rss_end_mb']} "
+                  f"(slope {stats['rss_slope_mb_per_min']}/min, peak {stats['peak_rss_mb']}, "
+                  f"private {stats['private_end_mb']}, shared {stats['shared_end_mb']})")
+    if growth["state"]:
+        print("\n📈 Stored state / files")
+        for key, values in growth["state"].items():
+            print(f"  {key}: {values['start']} -> {values['end']}")
     print_separator()
-    
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Dental AI Assistant load/soak test")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to generate load")
+    parser.add_argument("--rate", type=float, default=2, help="Scenario arrivals per second")
+    parser.add_argument("--upload-ratio", type=float, default=0.3, help="Fraction of scenarios that upload")
+    parser.add_argument("--chat-turns", type=int, default=3, help="Messages per chat session")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Seconds between chat turns")
+    parser.add_argument("--max-concurrency", type=int, default=50, help="Max in-flight scenarios")
+    parser.add_argument("--images", nargs="+", default=DEFAULT_IMAGES, help="Image paths or globs")
+    parser.add_argument("--jobs", action="store_true", help="Upload via background jobs and poll")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Job poll interval (s)")
+    parser.add_argument("--keep-sessions", action="store_true", help="Don't clear chat sessions")
+    parser.add_argument("--stats-interval", type=float, default=5, help="Seconds between /api/stats samples")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="Per-request timeout and job completion deadline (s)")
+    parser.add_argument("--report", default="loadtest_report.json", help="JSON report path")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    print("\n" + "🏥 DENTAL CHATBOT LOAD TEST ".center(70, "="))
     try:
-        # Test 1: Health check
-        test_health_check()
-        time.sleep(1)
-        
-        # Test 2: Upload X-ray (CHANGE THIS PATH TO YOUR IMAGE)
-        image_path = "tooth.jpg"  # 👈 Change this to your X-ray image path
-        print(f"\n📝 Note: Using image path: {image_path}")
-        print("If the image doesn't exist, please update the path in test.py")
-        
-        analysis_result = test_upload_xray(image_path)
-        
-        if analysis_result:
-            time.sleep(1)
-            
-            # Test 3: Chat tests
-            test_chat("What did you find in my X-ray?")
-            time.sleep(1)
-            
-            test_chat("What is a fractured tooth?")
-            time.sleep(1)
-            
-            test_chat("Should I be worried about the findings?")
-            time.sleep(1)
-            
-            # Test 4: Get image
-            test_get_image(analysis_result['output_image_path'])
-            time.sleep(1)
-            
-            # Test 5: Get current analysis
-            test_current_analysis()
-            time.sleep(1)
-            
-            # Test 6: Clear session
-            test_clear_session()
-        
-        print_separator()
-        print("🎉 ALL TESTS COMPLETED SUCCESSFULLY!".center(70))
-        print_separator()
-        
-    except requests.exceptions.ConnectionError:
+        report = asyncio.run(run(args))
+    except httpx.ConnectError:
         print("\n❌ ERROR: Cannot connect to the server!")
         print("Please make sure the FastAPI server is running:")
         print("  python main.py")
-        print("\nOr run with: uvicorn main:app --reload")
-    except Exception as e:
-        print(f"\n❌ TEST FAILED: {str(e)}")
-        import traceback
-        traceback.print_exc()
-
-def interactive_test():
-    """Interactive testing mode"""
-    print("\n" + "🔧 INTERACTIVE TEST MODE ".center(70, "="))
-    print("\nAvailable tests:")
-    print("1. Health Check")
-    print("2. Upload X-ray")
-    print("3. Chat")
-    print("4. Get Current Analysis")
-    print("5. Clear Session")
-    print("6. Run All Tests")
-    print("0. Exit")
-    
-    while True:
-        choice = input("\nSelect test number (0-6): ").strip()
-        
-        if choice == "0":
-            print("👋 Exiting...")
-            break
-        elif choice == "1":
-            test_health_check()
-        elif choice == "2":
-            path = input("Enter X-ray image path: ").strip()
-            test_upload_xray(path)
-        elif choice == "3":
-            message = input("Enter your message: ").strip()
-            test_chat(message)
-        elif choice == "4":
-            test_current_analysis()
-        elif choice == "5":
-            session = input("Enter session ID (default: test_session): ").strip() or "test_session"
-            test_clear_session(session)
-        elif choice == "6":
-            run_all_tests()
-            break
-        else:
-            print("Invalid choice, please try again")
+        raise SystemExit(1)
 
-if __name__ == "__main__":
-    import sys
-    
-    print("\n" + "🏥 DENTAL CHATBOT BACKEND TESTER ".center(70, "="))
-    print("\nMake sure the FastAPI server is running on http://localhost:8000")
-    print("Start server with: python main.py")
-    print_separator()
-    
-    if len(sys.argv) > 1 and sys.argv[1] == "--interactive":
-        interactive_test()
-    else:
-        run_all_tests()
\ No newline at end of file
+    print_report(report)
+    Path(args.report).write_text(json.dumps(report, indent=2))
+    print(f"💾 Report written to: {args.report}")
@@ -0,0 +1,85 @@
+import pytest
+
+from chat_agent import DentalChatAgent
+from chat_router import ChatRouter, DEFAULT_ROUTING_CONFIG
+from state_store import SessionStore
+
+
+MULTI_FINDING_CONTEXT = {
+    "detections": {"count": 7, "classes": {"Caries": 2, "Healthy_Tooth": 5}, "details": []},
+    "summary": "Analysis found 7 dental findings"
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(db_path=str(tmp_path / "state.db"))
+
+
+@pytest.mark.parametrize("message, context, expected", [
+    ("What is a fractured tooth?", MULTI_FINDING_CONTEXT, "quick"),
+    ("What is a small cavity called?", {}, "quick"),
+    ("Can you explain caries?", {}, "detailed"),
+    ("Should I be worried about the findings?", {}, "detailed"),
+    # Result questions only go to "detailed" when several kinds of findings were detected
+    ("What did you find in my X-ray?", MULTI_FINDING_CONTEXT, "detailed"),
+    ("What did you find in my X-ray?", {}, "quick"),
+    # Keywords match whole words only ("all" is not in "small")
+    ("Is a small spot normal?", MULTI_FINDING_CONTEXT, "quick"),
+    (" ".join(["tooth"] * 30), {}, "detailed"),
+])
+def test_default_rules(message, context, expected):
+    assert ChatRouter(DEFAULT_ROUTING_CONFIG).route(message, context) == expected
+
+
+def test_falls_back_to_default_route():
+    router = ChatRouter(DEFAULT_ROUTING_CONFIG)
+    assert router.route(" ".join(["tooth"] * 20)) == DEFAULT_ROUTING_CONFIG["default_route"]
+
+
+def test_unknown_rule_route_is_rejected():
+    config = {
+        "routes": {"quick": {"model": "gpt-4o-mini"}},
+        "rules": [{"route": "missing", "max_words": 5}],
+        "default_route": "quick"
+    }
+    with pytest.raises(ValueError, match="unknown routes"):
+        ChatRouter(config)
+
+
+def test_unknown_default_route_is_rejected():
+    config = {"routes": {"quick": {"model": "gpt-4o-mini"}}, "default_route": "missing"}
+    with pytest.raises(ValueError, match="unknown routes"):
+        ChatRouter(config)
+
+
+def test_chat_round_trip_with_fake_llm(monkeypatch, store):
+    monkeypatch.setenv("CHAT_LLM_PROVIDER", "fake")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+
+    agent = DentalChatAgent(store=store, router=ChatRouter(DEFAULT_ROUTING_CONFIG))
+    agent.update_xray_context(MULTI_FINDING_CONTEXT)
+
+    response = agent.chat("What is a fractured tooth?", "session-1")
+    agent.chat("Can you explain the treatment options?", "session-1")
+
+    assert "fake dental assistant" in response
+
+    history = store.get_history("session-1")
+    assert [m["role"] for m in history] == ["human", "ai", "human", "ai"]
+    assert history[0]["content"] == "What is a fractured tooth?"
+    assert history[1]["content"] == response
+
+    metrics = store.get_chat_metrics()
+    assert metrics["quick"]["requests"] == 1
+    assert metrics["detailed"]["requests"] == 1
+
+
+def test_history_is_trimmed(monkeypatch, store):
+    monkeypatch.setenv("CHAT_LLM_PROVIDER", "fake")
+
+    agent = DentalChatAgent(store=store, router=ChatRouter(DEFAULT_ROUTING_CONFIG))
+    for _ in range(8):
+        agent.chat("What is a crown?", "session-2")
+
+    assert len(agent.get_history("session-2")) == store.max_history